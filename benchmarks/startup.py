@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Measure regview startup time
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+COMMANDS = {
+    "python": [sys.executable, "-c", "pass"],
+    "import": [sys.executable, "-c", "import regview.regview"],
+    "version": [sys.executable, "-c", "import sys; from regview import regview; sys.argv[1:] = ['-V']; regview.main()"],
+}
+
+DIGEST = "sha256:" + "0" * 64
+
+
+class RegistryHandler(BaseHTTPRequestHandler):
+    """
+    Plain HTTP Docker Registry stand-in with token authentication & simulated latency
+    """
+    latency = 0.0
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """
+        Handle GET
+        """
+        time.sleep(self.latency)
+        headers = {}
+        if self.path.startswith("/token"):
+            status, body = 200, {"token": "token"}
+        elif self.headers.get("Authorization") != "Bearer token":
+            status, body = 401, {}
+            host = self.headers.get("Host")
+            headers["WWW-Authenticate"] = f'Bearer realm="http://{host}/token",service="bench"'
+        elif "/manifests/" in self.path:
+            status, body = 200, {
+                "schemaVersion": 2,
+                "mediaType": "application/vnd.docker.distribution.manifest.v2+json",
+                "config": {"digest": DIGEST},
+                "layers": [{"size": 1024}]}
+            headers["Docker-Content-Digest"] = DIGEST
+        elif "/blobs/" in self.path:
+            status, body = 200, {
+                "architecture": "amd64", "os": "linux", "created": "2020-03-04T06:39:52Z", "config": {}}
+        else:
+            status, body = 200, {}
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Docker-Distribution-Api-Version", "registry/2.0")
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+def bench(command, runs, env=None, warmup=False):
+    """
+    Returns the wall times in milliseconds of running command
+    """
+    if warmup:
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, env=env)
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, check=True, stdout=subprocess.DEVNULL, env=env)
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def report(name, times):
+    """
+    Print statistics
+    """
+    print(f"{name:<16}\tmin {min(times):8.2f}ms\tmedian {statistics.median(times):8.2f}ms")
+
+
+def main():
+    """
+    Main function
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--runs', type=int, default=20, help="Number of runs")
+    parser.add_argument('-l', '--latency', type=float, default=20, help="Simulated registry latency in milliseconds")
+    opts = parser.parse_args()
+    for name, command in COMMANDS.items():
+        report(name, bench(command, opts.runs))
+
+    RegistryHandler.latency = opts.latency / 1000
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RegistryHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # The registry is given without scheme so the https probe & http fallback are measured
+    command = [
+        sys.executable, "-c", "from regview import regview; regview.main()",
+        "-u", "user", "-p", "pass", f"127.0.0.1:{server.server_address[1]}/repo:latest"]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        env = dict(os.environ, XDG_CACHE_HOME=tmpdir, DOCKER_CONFIG=tmpdir)
+        report("image --no-cache", bench(command + ["--no-cache"], opts.runs, env=env))
+        report("image cached", bench(command, opts.runs, env=env, warmup=True))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -19,7 +19,7 @@ class GuessAuth2(GuessAuth):
     url = None
     service = None
 
-    def __init__(self, *args, debug=False, headers=None, verify=True, **kwargs):
+    def __init__(self, *args, debug=False, headers=None, verify=True, transport=None, **kwargs):
         super().__init__(*args, **kwargs)
         self.session = requests.Session()
         self.debug = debug
@@ -29,11 +29,13 @@ class GuessAuth2(GuessAuth):
         if headers:
             self.session.headers.update(headers)
         self.session.verify = verify
-        self.session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=100))
+        transport = transport or requests.adapters.HTTPAdapter(pool_maxsize=100)
+        self.session.mount("http://", transport)
+        self.session.mount("https://", transport)
 
-    def get_token(self, params=None, use_post=False):
+    def get_token(self, params=None, use_post=False, fatal=True):
         """
-        Get token
+        Get token.  Exits on error if fatal, raises otherwise
         """
         params = params or {}
         if 'service' not in params:
@@ -43,6 +45,8 @@ class GuessAuth2(GuessAuth):
             got = self.session.request(method, self.url, params=params)
             got.raise_for_status()
         except RequestException as err:
+            if not fatal:
+                raise
             logging.error("%s", err)
             sys.exit(1)
         data = got.json()
@@ -53,9 +57,9 @@ class GuessAuth2(GuessAuth):
         url = params['Bearer realm']
         del params['Bearer realm']
 
-        if self.url is None:
-            self.url = url
-            self.service = params['service']
+        # The realm may differ from a cached one
+        self.url = url
+        self.service = params['service']
 
         # Code adapted from:
         # https://github.com/requests/toolbelt/blob/master/requests_toolbelt/auth/guess.py
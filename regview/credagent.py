@@ -0,0 +1,184 @@
+"""
+Short-lived agent holding the output of Docker credential helpers in memory.
+It listens on a Unix socket only accessible by the user and exits when its entries expire
+"""
+
+import json
+import os
+import socket
+import stat
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def get_socket_path():
+    """
+    Returns the path of the agent socket or None if not supported
+    """
+    if not hasattr(socket, "AF_UNIX") or not hasattr(os, "getuid"):
+        return None
+    runtime_dir = os.getenv("XDG_RUNTIME_DIR")
+    directory = os.path.join(runtime_dir, "regview") if runtime_dir \
+        else os.path.join(tempfile.gettempdir(), f"regview-{os.getuid()}")
+    try:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        info = os.lstat(directory)
+    except OSError:
+        return None
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        return None
+    return os.path.join(directory, "credentials.sock")
+
+
+def _request(message, timeout=2):
+    """
+    Send a request to the agent and return its response
+    """
+    path = get_socket_path()
+    if path is None:
+        raise OSError("Unix sockets not supported")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(json.dumps(message).encode() + b"\n")
+        with sock.makefile("rb") as file:
+            return json.loads(file.readline())
+
+
+def get_credentials(key, config_mtime):
+    """
+    Get credentials from the agent
+    """
+    try:
+        creds = _request({"op": "get", "key": key, "config_mtime": config_mtime}).get('credentials')
+    except (OSError, ValueError):
+        return None
+    return tuple(creds) if creds else None
+
+
+def _spawn(ttl):
+    """
+    Start the agent in the background
+    """
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (package_dir, os.getenv("PYTHONPATH")))))
+    # The agent forks itself into the background
+    subprocess.run(
+        [sys.executable, "-m", "regview.credagent", str(ttl)],
+        stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        env=env, check=False)
+
+
+def put_credentials(key, config_mtime, creds, ttl):
+    """
+    Store credentials in the agent for ttl seconds, starting it if needed
+    """
+    message = {"op": "put", "key": key, "config_mtime": config_mtime, "credentials": creds, "ttl": ttl}
+    try:
+        _request(message)
+        return
+    except (OSError, ValueError):
+        pass
+    _spawn(ttl)
+    for _ in range(20):
+        time.sleep(0.05)
+        try:
+            _request(message)
+            return
+        except (OSError, ValueError):
+            pass
+
+
+def stop():
+    """
+    Stop the agent
+    """
+    try:
+        _request({"op": "quit"})
+    except (OSError, ValueError):
+        pass
+
+
+def _peer_is_user(conn):
+    """
+    Check that the peer is running as the same user where supported
+    """
+    if not hasattr(socket, "SO_PEERCRED"):
+        return True
+    _, uid, _ = struct.unpack("3i", conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")))
+    return uid == os.getuid()
+
+
+def _handle(conn, entries):
+    """
+    Handle a request.  Returns the expiration time of a new entry or None to quit
+    """
+    with conn.makefile("rb") as file:
+        message = json.loads(file.readline())
+    now = time.monotonic()
+    response, expires = {}, now
+    if message['op'] == "quit":
+        expires = None
+    elif message['op'] == "get":
+        entry = entries.get(message['key'])
+        if entry and entry[0] > now and entry[1] == message['config_mtime']:
+            response = {"credentials": entry[2]}
+    elif message['op'] == "put":
+        expires = now + message['ttl']
+        entries[message['key']] = (expires, message['config_mtime'], message['credentials'])
+    conn.sendall(json.dumps(response).encode() + b"\n")
+    return expires
+
+
+def serve(ttl):
+    """
+    Serve requests until all entries expire
+    """
+    path = get_socket_path()
+    if path is None:
+        return
+    if os.path.exists(path):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(path)
+                return  # Another agent is running
+            except OSError:
+                os.unlink(path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        umask = os.umask(0o177)
+        try:
+            sock.bind(path)
+        finally:
+            os.umask(umask)
+        sock.listen()
+        sock.settimeout(1)
+        entries = {}
+        expires = time.monotonic() + ttl
+        try:
+            while time.monotonic() < expires:
+                try:
+                    conn, _ = sock.accept()
+                except socket.timeout:
+                    continue
+                with conn:
+                    if not _peer_is_user(conn):
+                        continue
+                    try:
+                        entry_expires = _handle(conn, entries)
+                    except (OSError, ValueError, KeyError, TypeError):
+                        continue
+                    if entry_expires is None:
+                        break
+                    expires = max(expires, entry_expires)
+        finally:
+            os.unlink(path)
+
+
+if __name__ == '__main__':
+    if os.fork():
+        os._exit(0)  # pylint: disable=protected-access
+    os.setsid()
+    serve(int(sys.argv[1]))
@@ -3,50 +3,70 @@ Docker Registry module
 """
 
 import fnmatch
+import itertools
 import logging
 import sys
+import threading
 
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
 from urllib.parse import urlparse
 
 import requests
-from requests.exceptions import RequestException
+from requests.exceptions import HTTPError, RequestException
 from urllib3 import disable_warnings
 
-from .auth import GuessAuth2
-from .utils import get_docker_credentials, print_response
+from .profiling import span
+from .utils import get_docker_credentials, print_response, load_registry_state, save_registry_state
 
 
-class DockerRegistry:
+class DockerRegistry:  # pylint: disable=too-many-instance-attributes
     """
     Class to implement Docker Registry methods
     """
     MANIFEST_V2 = "application/vnd.docker.distribution.manifest.v2+json"
     MANIFEST_V2_FAT = "application/vnd.docker.distribution.manifest.list.v2+json"
 
-    def __init__(self, registry, auth=None, cert=None, headers=None, verify=True, debug=False):  # pylint: disable=too-many-arguments
+    def __init__(self, registry, auth=None, cert=None, headers=None, verify=True, debug=False, *, cache_ttl=0, transport=None, page_size=None, prefetch=True, creds_cache_ttl=0):  # pylint: disable=too-many-arguments
         self.session = requests.Session()
-        self.session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=100))
-        self.session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=100))
+        transport = transport or requests.adapters.HTTPAdapter(pool_maxsize=100)
+        self.session.mount("http://", transport)
+        self.session.mount("https://", transport)
         logging.basicConfig(format='%(levelname)s: %(message)s')
         if debug:
             self._enable_debug()
-        auth = auth or get_docker_credentials(registry)
+        auth = auth or get_docker_credentials(registry, cache_ttl=creds_cache_ttl)
         if auth:
-            auth = GuessAuth2(*auth, headers=headers, verify=verify, debug=debug)
+            from .auth import GuessAuth2  # pylint: disable=import-outside-toplevel
+            auth = GuessAuth2(*auth, headers=headers, verify=verify, debug=debug, transport=transport)
         self.session.auth = auth
         self.session.cert = cert
         if headers:
             self.session.headers.update(headers)
         self.session.verify = verify
         disable_warnings()
-        self.registry = self._check_registry(registry)
+        self.page_size = page_size
+        self.prefetch = prefetch
+        self.api_version = None
+        self._cache_key = registry if cache_ttl else None
+        self._lock = threading.Lock()
+        self._reprobed = False
+        state = load_registry_state(registry, cache_ttl) if cache_ttl else None
+        self._cached = bool(state and state.get('registry'))
+        if self._cached:
+            self.registry = state['registry']
+            self.api_version = state.get('api_version')
+            if auth and state.get('realm'):
+                auth.url, auth.service = state['realm'], state.get('service')
+        else:
+            self.registry = self._check_registry(registry)
+            self._save_state()
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        if isinstance(self.session.auth, GuessAuth2):
+        if self.session.auth:
             self.session.auth.session.close()
         self.session.close()
 
@@ -57,6 +77,73 @@ class DockerRegistry:
         requests_log.propagate = True
         self.session.hooks['response'].append(print_response)
 
+    def _save_state(self):
+        """
+        Save resolved scheme, API version & auth challenge for registry
+        """
+        if self._cache_key is None:
+            return
+        state = {'registry': self.registry, 'api_version': self.api_version}
+        if self.session.auth and self.session.auth.url:
+            state.update({'realm': self.session.auth.url, 'service': self.session.auth.service})
+        save_registry_state(self._cache_key, state)
+
+    def _reprobe(self):
+        """
+        Probe the registry again if the cached state was used.
+        Returns True if the registry was probed again, by this or another thread
+        """
+        with self._lock:
+            if self._cached:
+                logging.debug("%s: cached state is stale, probing again", self._cache_key)
+                self._cached = False
+                if self.session.auth:
+                    self.session.auth.url = self.session.auth.service = None
+                self._get_token_repo.cache_clear()
+                self.registry = self._check_registry(self._cache_key)
+                self._save_state()
+                self._reprobed = True
+            return self._reprobed
+
+    def _realm(self):
+        """
+        Get the current token realm
+        """
+        return self.session.auth.url if self.session.auth else None
+
+    def _request(self, method, url, **kwargs):
+        """
+        Send a request, probing the registry again if the cached state is stale
+        """
+        registry, realm = self.registry, self._realm()
+        try:
+            got = self.session.request(method, url, **kwargs)
+        except requests.exceptions.ConnectionError:
+            if not url.startswith(registry) or not self._reprobe():
+                raise
+            got = self.session.request(method, f"{self.registry}{url[len(registry):]}", **kwargs)
+        if self._realm() != realm:
+            # The registry challenged us with a different realm than the cached one
+            self._get_token_repo.cache_clear()
+            self._save_state()
+        return got
+
+    def _get_token(self, scope):
+        """
+        Get authorization header for scope
+        """
+        auth = self.session.auth
+        if not (auth and auth.url):
+            return {}
+        try:
+            # A token request to a cached realm may fail because the realm is stale
+            token = auth.get_token(params={"scope": scope}, fatal=not self._cached)
+        except RequestException as err:
+            logging.debug("%s: %s", auth.url, err)
+            self._reprobe()
+            return self._get_token(scope)
+        return {"Authorization": token}
+
     def _check_registry(self, registry):
         """
         Check if registry starts with a scheme and adjust accordingly
@@ -68,16 +155,19 @@ class DockerRegistry:
             except RequestException as err:
                 logging.error("%s", err)
                 sys.exit(1)
+            self.api_version = got.headers.get('docker-distribution-api-version')
             return registry
         try:
             got = self.session.get(f"https://{registry}/v2/")
             if got.status_code != 401:
                 got.raise_for_status()
+            self.api_version = got.headers.get('docker-distribution-api-version')
             return f"https://{registry}"
         except RequestException:
             try:
                 got = self.session.get(f"http://{registry}/v2/")
                 got.raise_for_status()
+                self.api_version = got.headers.get('docker-distribution-api-version')
                 return f"http://{registry}"
             except RequestException as err:
                 logging.error("%s", err)
@@ -93,46 +183,78 @@ class DockerRegistry:
         Get token for repo
         Note: operations should be a comma separated string of "pull", "push" or "delete"
         """
-        if self.session.auth and self.session.auth.url:
-            token = self.session.auth.get_token(params={"scope": f"repository:{repo}:{operations}"})
-            return {"Authorization": token}
-        return {}
+        return self._get_token(f"repository:{repo}:{operations}")
 
-    def _get_paginated(self, url, string, **kwargs):
+    def _get_page(self, url, string, **kwargs):
         """
-        Get paginated results
+        Get a page of results and the URL of the next page
         """
-        host = "://".join(urlparse(url)[0:2])
-        while True:
-            try:
-                got = self.session.get(url, **kwargs)
-                got.raise_for_status()
-            except RequestException as err:
-                logging.error("%s: %s", url, err)
-                return None
+        with span("catalog" if string == "repositories" else "tags"):
+            got = self._request("GET", url, **kwargs)
+            got.raise_for_status()
             items = got.json()[string]
-            if not items:
-                return None
-            yield from items
-            if 'Link' in got.headers:
-                url = requests.utils.parse_header_links(got.headers['Link'])[0]['url']
-                if url.startswith("/v2/"):
-                    url = f"{host}{url}"
-            else:
-                break
+        # The request may have been retried on another registry URL
+        host = "://".join(urlparse(got.url)[0:2])
+        if 'Link' in got.headers:
+            url = requests.utils.parse_header_links(got.headers['Link'])[0]['url']
+            if url.startswith("/v2/"):
+                url = f"{host}{url}"
+            return items, url
+        return items, None
+
+    def _get_first_page(self, url, string, **kwargs):
+        """
+        Get the first page of results asking for page_size items
+        """
+        if not self.page_size:
+            return self._get_page(url, string, **kwargs)
+        try:
+            # The Link header of the next pages already has the n parameter
+            return self._get_page(url, string, params={'n': self.page_size}, **kwargs)
+        except HTTPError as err:
+            # Docker Distribution returns 400 PAGINATION_NUMBER_INVALID if n is above its maximum
+            if err.response is None or err.response.status_code != 400:
+                raise
+        logging.debug("%s: retrying without n=%s", url, self.page_size)
+        self.page_size = None
+        return self._get_page(url, string, **kwargs)
+
+    def _get_paginated(self, url, string, **kwargs):
+        """
+        Get paginated results, fetching the next page in the background if prefetch is enabled
+        """
+        executor = None
+        try:
+            items, next_url = self._get_first_page(url, string, **kwargs)
+            while items:
+                future = None
+                if next_url and self.prefetch:
+                    if executor is None:
+                        executor = ThreadPoolExecutor(max_workers=1)  # pylint: disable=consider-using-with
+                    future = executor.submit(self._get_page, next_url, string, **kwargs)
+                yield from items
+                if not next_url:
+                    break
+                url = next_url
+                items, next_url = future.result() if future else self._get_page(url, string, **kwargs)
+        except RequestException as err:
+            logging.error("%s: %s", url, err)
+        finally:
+            if executor is not None:
+                executor.shutdown()
 
     def get_repos(self, pattern=None):
         """
         Get repositories
         """
+        headers = self._get_token("registry:catalog:*")
         url = f"{self.registry}/v2/_catalog"
-        headers = {}
-        if self.session.auth and self.session.auth.url:
-            token = self.session.auth.get_token(params={"scope": "registry:catalog:*"})
-            headers.update({"Authorization": token})
         repos = self._get_paginated(url, "repositories", headers=headers)
         if repos and pattern:
-            return fnmatch.filter(repos, pattern)
+            repos = (repo for repo in repos if fnmatch.fnmatch(repo, pattern))
+            # Peek at the first match so that no matches is still falsy
+            first = next(repos, None)
+            return [] if first is None else itertools.chain([first], repos)
         return repos
 
     def get_tags(self, repo, pattern):
@@ -146,6 +268,7 @@ class DockerRegistry:
             tags = fnmatch.filter(tags, pattern)
         return tags
 
+    @span("manifests")
     def get_manifest(self, repo, tag, fat=False):
         """
         Get the manifest
@@ -157,7 +280,7 @@ class DockerRegistry:
         headers = self._get_token_repo(repo)
         headers.update({"Accept": content_type})
         try:
-            got = self.session.get(url, headers=headers)
+            got = self._request("GET", url, headers=headers)
             got.raise_for_status()
         except RequestException as err:
             fmt = "%s@%s: %s" if tag.startswith("sha256:") else "%s:%s: %s"
@@ -170,13 +293,14 @@ class DockerRegistry:
         # Some registries don't return this header and need an additional HEAD request
         if not manifest['docker-content-digest']:
             try:
-                got = self.session.head(url, headers=headers)
+                got = self._request("HEAD", url, headers=headers)
                 got.raise_for_status()
                 manifest['docker-content-digest'] = got.headers.get('docker-content-digest')
             except RequestException:
                 pass
         return manifest
 
+    @span("manifests")
     def get_digest(self, repo, tag):
         """
         Get digest
@@ -186,7 +310,7 @@ class DockerRegistry:
         headers = self._get_token_repo(repo)
         headers.update({"Accept": content_type})
         try:
-            got = self.session.head(url, headers=headers)
+            got = self._request("HEAD", url, headers=headers)
             got.raise_for_status()
             return got.headers.get('docker-content-digest')
         except RequestException as err:
@@ -202,13 +326,14 @@ class DockerRegistry:
         headers = self._get_token_repo(repo, "delete")
         headers.update({"Accept": content_type})
         try:
-            got = self.session.delete(url, headers=headers)
+            got = self._request("DELETE", url, headers=headers)
             got.raise_for_status()
             return True
         except RequestException as err:
             logging.error("%s@%s: %s", repo, digest, err)
         return False
 
+    @span("blobs")
     def get_blob(self, repo, digest):
         """
         Get blob for repo
@@ -216,7 +341,7 @@ class DockerRegistry:
         url = f"{self.registry}/v2/{repo}/blobs/{digest}"
         headers = self._get_token_repo(repo)
         try:
-            got = self.session.get(url, headers=headers)
+            got = self._request("GET", url, headers=headers)
             got.raise_for_status()
         except RequestException as err:
             logging.error("%s@%s: %s", repo, digest, err)
@@ -0,0 +1,150 @@
+"""
+Profiling support
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+from collections import Counter
+from contextlib import contextmanager
+
+
+_profiler = None  # pylint: disable=invalid-name
+
+
+@contextmanager
+def span(name):
+    """
+    Record the wall & CPU time of a phase when profiling.
+    May also be used as a decorator
+    """
+    profiler = _profiler
+    if profiler is None:
+        yield
+        return
+    wall, cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield
+    finally:
+        profiler.add_span(name, time.perf_counter() - wall, time.thread_time() - cpu)
+
+
+class Sampler(threading.Thread):
+    """
+    Wall-clock sampling profiler for all threads producing collapsed stacks
+    """
+
+    def __init__(self, interval=0.005):
+        super().__init__(name="regview-sampler", daemon=True)
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            names = {thread.ident: re.sub(r"_\d+$", "", thread.name) for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():  # pylint: disable=protected-access
+                if ident == self.ident:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        """
+        Stop sampling
+        """
+        self._stop_event.set()
+        self.join()
+
+    def write(self, filename):
+        """
+        Write collapsed stacks suitable for flamegraph.pl or speedscope
+        """
+        with open(filename, "w", encoding="utf-8") as file:
+            for stack, count in sorted(self.stacks.items()):
+                file.write(f"{stack} {count}\n")
+
+
+class Profiler:
+    """
+    Profile a run, writing PREFIX.pstats, PREFIX.collapsed & PREFIX.spans.json
+    and printing a summary of the timing spans to stderr
+    """
+
+    def __init__(self, prefix, interval=0.005):
+        self.prefix = prefix
+        self.spans = {}
+        self.sampler = Sampler(interval)
+        self._profiles = []
+        self._lock = threading.Lock()
+        self._wall = self._cpu = None
+
+    def add_span(self, name, wall, cpu):
+        """
+        Add the times of a span
+        """
+        with self._lock:
+            calls, total_wall, total_cpu = self.spans.get(name, (0, 0.0, 0.0))
+            self.spans[name] = (calls + 1, total_wall + wall, total_cpu + cpu)
+
+    def _profile_thread(self, *_):
+        """
+        Hook for threading.setprofile() to profile new threads
+        """
+        import cProfile  # pylint: disable=import-outside-toplevel
+        profile = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(profile)
+        profile.enable()
+
+    def __enter__(self):
+        global _profiler  # pylint: disable=global-statement,invalid-name
+        import cProfile  # pylint: disable=import-outside-toplevel
+        _profiler = self
+        self.sampler.start()
+        # Since Python 3.12 cProfile uses sys.monitoring and profiles all threads
+        if sys.version_info < (3, 12):
+            threading.setprofile(self._profile_thread)
+        self._wall, self._cpu = time.perf_counter(), time.process_time()
+        profile = cProfile.Profile()
+        self._profiles.append(profile)
+        profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _profiler  # pylint: disable=global-statement,invalid-name
+        self._profiles[0].disable()
+        wall, cpu = time.perf_counter() - self._wall, time.process_time() - self._cpu
+        threading.setprofile(None)
+        _profiler = None
+        self.sampler.stop()
+        import pstats  # pylint: disable=import-outside-toplevel
+        stats = pstats.Stats(*self._profiles)
+        stats.dump_stats(f"{self.prefix}.pstats")
+        self.sampler.write(f"{self.prefix}.collapsed")
+        spans = {
+            name: {"calls": calls, "wall": wall_, "cpu": cpu_, "wait": max(wall_ - cpu_, 0.0)}
+            for name, (calls, wall_, cpu_) in self.spans.items()}
+        spans["total"] = {"calls": 1, "wall": wall, "cpu": cpu, "wait": max(wall - cpu, 0.0)}
+        with open(f"{self.prefix}.spans.json", "w", encoding="utf-8") as file:
+            json.dump(spans, file, indent=2)
+        self.print_spans(spans)
+
+    @staticmethod
+    def print_spans(spans, file=None):
+        """
+        Print timing spans.  Times of phases are summed over all threads
+        """
+        file = file or sys.stderr
+        print(f"{'PHASE':<12}{'CALLS':>8}{'WALL':>12}{'CPU':>12}{'WAIT':>12}", file=file)
+        for name, data in spans.items():
+            print(f"{name:<12}{data['calls']:>8}{data['wall']:>12.3f}{data['cpu']:>12.3f}{data['wait']:>12.3f}", file=file)
@@ -8,13 +8,15 @@ import platform
 import re
 import sys
 
-from collections import OrderedDict
+from collections import OrderedDict, deque
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 from functools import lru_cache
 from getpass import getpass
 from shutil import get_terminal_size
 
 from .docker_registry import DockerRegistry
+from .profiling import Profiler, span
 from .utils import pretty_date, pretty_size, is_glob
 from . import __version__
 
@@ -104,19 +106,11 @@ class DockerRegistryInfo(DockerRegistry):
                 info['CompressedSize'] = pretty_size(info['CompressedSize'])
         return info
 
-    def print_fullinfo(self, repo, tag="latest"):
+    @span("render")
+    def _print_fullinfo(self, infos):
         """
-        Print full info about image
+        Print full info
         """
-        # Filter by current arch & OS if neither --all, --arch or --os were specified
-        if not opts.all:
-            os_, arch = get_os_arch()
-            opts.os, opts.arch = {os_}, {arch}
-        infos = self.get_info(repo, tag, full=True)
-        if not opts.all:
-            opts.os = opts.arch = None
-        if infos is None:
-            return
         if isinstance(infos, list):
             for info in infos:
                 for key, value in sorted(info.items()):
@@ -141,6 +135,21 @@ class DockerRegistryInfo(DockerRegistry):
         if opts.verbose:
             self.print_history(info['history'])
 
+    def print_fullinfo(self, repo, tag="latest"):
+        """
+        Print full info about image
+        """
+        # Filter by current arch & OS if neither --all, --arch or --os were specified
+        if not opts.all:
+            os_, arch = get_os_arch()
+            opts.os, opts.arch = {os_}, {arch}
+        infos = self.get_info(repo, tag, full=True)
+        if not opts.all:
+            opts.os = opts.arch = None
+        if infos is None:
+            return
+        self._print_fullinfo(infos)
+
     @staticmethod
     def print_history(history):
         """
@@ -150,6 +159,7 @@ class DockerRegistryInfo(DockerRegistry):
             print(f"History[{i}]\t\t{item['created_by']}")
 
     @staticmethod
+    @span("render")
     def print_info(repo, tag, info, fmt):
         """
         Print info about image
@@ -169,12 +179,23 @@ class DockerRegistryInfo(DockerRegistry):
             values.append(info['architecture'])
         print(fmt.format(*values))
 
-    def get_images(self, repos, pattern_tag=None):
+    def get_images(self, repos, pattern_tag=None, max_workers=2, lookahead=8):
         """
-        Get images"
+        Get images, listing tags for repositories as they arrive from the catalog
         """
-        with ThreadPoolExecutor(max_workers=2) as executor:
-            yield from executor.map(lambda r: (r, self.get_tags(r, pattern_tag)), repos)
+        def get_tags(repo):
+            tags = self.get_tags(repo, pattern_tag)
+            return repo, None if tags is None else list(tags)
+
+        # Unlike executor.map() this doesn't consume the whole catalog before yielding
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = deque()
+            for repo in repos:
+                futures.append(executor.submit(get_tags, repo))
+                while futures and (futures[0].done() or len(futures) > lookahead):
+                    yield futures.popleft().result()
+            while futures:
+                yield futures.popleft().result()
 
     def delete_images(self, repo_pattern, tag_pattern):
         """
@@ -187,7 +208,7 @@ class DockerRegistryInfo(DockerRegistry):
             return
         for repo in repos:
             tags = self.get_tags(repo, tag_pattern)
-            with ThreadPoolExecutor() as executor:
+            with ThreadPoolExecutor(max_workers=opts.workers) as executor:
                 digests = executor.map(lambda t, r=repo: self.get_digest(r, t), tags)
                 for digest in digests:
                     if opts.dry_run or opts.verbose:
@@ -217,8 +238,10 @@ class DockerRegistryInfo(DockerRegistry):
         fmt = "  ".join(fmt.values())
         print(fmt.format(*keys))
         full = opts.all or opts.verbose
-        with ThreadPoolExecutor() as executor:
-            for repo, tags in self.get_images(repos, tag_pattern):
+        tag_workers = opts.workers or 2
+        with ThreadPoolExecutor(max_workers=opts.workers) as executor:
+            for repo, tags in self.get_images(
+                    repos, tag_pattern, max_workers=tag_workers, lookahead=max(8, 4 * tag_workers)):
                 if tags is None:
                     continue
                 for tag, infos in executor.map(
@@ -257,18 +280,33 @@ def parse_opts():
     parser.add_argument(
         '-C', '--cacert',
         help="CA certificate for server")
+    parser.add_argument(
+        '--creds-cache', metavar="SECONDS", type=int, default=0,
+        help="Keep output of Docker credential helpers in memory for SECONDS")
     parser.add_argument(
         '--debug', action='store_true',
         help="Enable debug")
     parser.add_argument(
         '--digests', action='store_true',
         help="Show digests")
+    parser.add_argument(
+        '--http2', action='store_true',
+        help="Use HTTP/2 (requires httpx[http2])")
     parser.add_argument(
         '--insecure', action='store_true',
         help="Allow insecure server connections")
+    parser.add_argument(
+        '--no-cache', action='store_true',
+        help="Don't use cached registry state")
     parser.add_argument(
         '--no-trunc', action='store_true',
         help="Don't truncate output")
+    parser.add_argument(
+        '--page-size', type=int, default=1000,
+        help="Number of repositories or tags to request per page (0 for registry default)")
+    parser.add_argument(
+        '--profile', metavar="PREFIX",
+        help="Profile and write PREFIX.pstats, PREFIX.collapsed & PREFIX.spans.json")
     parser.add_argument(
         '--raw', action='store_true',
         help="Raw values for date and size")
@@ -281,6 +319,9 @@ def parse_opts():
     parser.add_argument(
         '-v', '--verbose', action='store_true',
         help="Show more information")
+    parser.add_argument(
+        '--workers', type=int,
+        help="Number of concurrent requests (default: 100 with --http2)")
     parser.add_argument(
         '--delete', action='store_true',
         help="Delete images. USE WITH CAUTION!")
@@ -291,7 +332,11 @@ def parse_opts():
         '-V', '--version', action='store_true',
         help="Show version and exit")
     parser.add_argument('image', nargs='?', help="REGISTRY[/REPOSITORY[:TAG|@DIGEST]]")
-    return parser.parse_args()
+    args = parser.parse_args()
+    # HTTP/2 multiplexes the requests over a few connections
+    if args.workers is None and args.http2:
+        args.workers = 100
+    return args
 
 
 def main():
@@ -312,18 +357,30 @@ def main():
     if opts.arch or opts.os:
         opts.arch, opts.os = set(opts.arch if opts.arch else []), set(opts.os if opts.os else [])
         opts.all = True
+    transport = None
+    if opts.http2:
+        try:
+            from .transport import HTTP2Adapter  # pylint: disable=import-outside-toplevel
+        except ImportError:
+            sys.exit("--http2 requires httpx[http2]")
+        transport = HTTP2Adapter()
     match = re.match(r'((?:https?://)?[^:/]+(?::[0-9]+)?)/*(.*)', opts.image)
     registry, image = match.group(1), match.group(2)
     pattern_repo = pattern_tag = None
     if '@' not in image and is_glob(image):
         pattern_repo, pattern_tag = image.split(':', 1) if ':' in image else (image, None)
-    with DockerRegistryInfo(
+    profiler = Profiler(opts.profile) if opts.profile else nullcontext()
+    with profiler, DockerRegistryInfo(
             registry,
             auth=(opts.username, opts.password) if opts.username else None,
             cert=(opts.cert, opts.key) if opts.cert and opts.key else opts.cert,
             headers={'User-Agent': f"regview/{__version__}"},
             verify=opts.cacert if opts.cacert else not opts.insecure,
-            debug=opts.debug) as reg:
+            debug=opts.debug,
+            cache_ttl=0 if opts.no_cache else 3600,
+            transport=transport,
+            page_size=opts.page_size,
+            creds_cache_ttl=opts.creds_cache) as reg:
         if image and not pattern_repo:
             sep = '@' if '@' in image else ':'
             if opts.delete:
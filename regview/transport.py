@@ -0,0 +1,111 @@
+"""
+Transport adapters
+"""
+
+import io
+import ssl
+import threading
+
+import h2  # noqa: F401  # pylint: disable=unused-import  # needed by httpx for HTTP/2
+import httpx
+import requests
+
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import DEFAULT_CA_BUNDLE_PATH, get_encoding_from_headers
+from urllib3 import HTTPResponse
+
+
+class HTTP2Adapter(BaseAdapter):
+    """
+    Requests transport adapter that multiplexes requests over HTTP/2 connections with httpx.
+    HTTP/2 is negotiated with ALPN on https:// and falls back to HTTP/1.1 otherwise.
+    With prior_knowledge=True, HTTP/2 is also used on http:// without negotiation (h2c).
+    """
+
+    def __init__(self, max_connections=10, prior_knowledge=False):
+        super().__init__()
+        self.max_connections = max_connections
+        self.prior_knowledge = prior_knowledge
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _ssl_context(verify, cert):
+        """
+        Build an SSL context from the requests verify & cert arguments
+        """
+        if verify is False:
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        else:
+            context = ssl.create_default_context(
+                cafile=DEFAULT_CA_BUNDLE_PATH if verify is True else verify)
+        if cert:
+            if isinstance(cert, str):
+                context.load_cert_chain(cert)
+            else:
+                context.load_cert_chain(*cert)
+        return context
+
+    def _get_client(self, verify, cert):
+        """
+        Get a client for the verify & cert combination
+        """
+        key = (verify, cert)
+        with self._lock:
+            if key not in self._clients:
+                self._clients[key] = httpx.Client(
+                    http1=not self.prior_knowledge,
+                    http2=True,
+                    verify=self._ssl_context(verify, cert),
+                    limits=httpx.Limits(max_connections=self.max_connections),
+                    timeout=None)
+            return self._clients[key]
+
+    def build_response(self, req, resp):
+        """
+        Build a requests Response from an httpx Response
+        """
+        response = requests.Response()
+        response.status_code = resp.status_code
+        response.headers = CaseInsensitiveDict(resp.headers.items())
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.reason = resp.reason_phrase
+        response.url = req.url
+        response.request = req
+        response.connection = self
+        # The body is already decoded by httpx
+        response._content = resp.content  # pylint: disable=protected-access
+        response.raw = HTTPResponse(
+            body=io.BytesIO(resp.content), headers=resp.headers.items(), status=resp.status_code,
+            version=20 if resp.http_version == "HTTP/2" else 11,
+            preload_content=False, decode_content=False)
+        return response
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        """
+        Send a PreparedRequest
+        """
+        if isinstance(timeout, tuple):
+            timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+        client = self._get_client(verify, cert)
+        try:
+            resp = client.request(
+                request.method, request.url, headers=request.headers.items(),
+                content=request.body, timeout=timeout)
+        except httpx.TimeoutException as err:
+            raise requests.exceptions.Timeout(err, request=request) from err
+        except httpx.HTTPError as err:
+            raise requests.exceptions.ConnectionError(err, request=request) from err
+        return self.build_response(request, resp)
+
+    def close(self):
+        """
+        Close all clients
+        """
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
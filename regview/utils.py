@@ -6,14 +6,11 @@ import base64
 import json
 import os
 import re
+import tempfile
+import time
 
 from datetime import timezone
 
-import dockerpycreds
-import dateutil.parser
-
-from requests_toolbelt.utils import dump
-
 
 def is_glob(string):
     """
@@ -26,6 +23,9 @@ def print_response(got, *args, **kwargs):  # pylint: disable=unused-argument
     """
     Print response to aid in debugging
     """
+    from requests_toolbelt.utils import dump  # pylint: disable=import-outside-toplevel
+    # Responses from HTTP2Adapter have version 20 which dump doesn't know
+    dump.HTTP_VERSIONS.setdefault(20, b'2')
     got.hook_called = True
     print(dump.dump_all(got).decode('utf-8'))
     return got
@@ -46,20 +46,77 @@ def pretty_date(string):
     """
     Converts date/time string in ISO-8601 format to date(1)
     """
+    import dateutil.parser  # pylint: disable=import-outside-toplevel
     # utc_date = datetime.fromisoformat(re.sub(r"\.\d+Z$", "+00:00", string))  # Python 3.7+ only
     utc_date = dateutil.parser.isoparse(string).replace(tzinfo=timezone.utc)
     return utc_date.astimezone().strftime("%a %b %d %H:%M:%S %Z %Y")
 
 
-def get_docker_credentials(registry):
+# Parsed Docker config files keyed by path: (mtime, config)
+_docker_configs = {}
+
+# Credential helper output keyed by (helper, registry): (timestamp, config mtime, credentials)
+_helper_credentials = {}
+
+CREDS_HELPER_TTL = 300
+
+
+def _load_docker_config(config_file):
+    """
+    Loads the Docker config file, reusing the parsed copy if it wasn't modified.
+    Returns the modification time & the config
+    """
+    try:
+        mtime = os.stat(config_file).st_mtime_ns
+    except OSError:
+        mtime = None
+    if mtime is not None and config_file in _docker_configs:
+        cached_mtime, config = _docker_configs[config_file]
+        if cached_mtime == mtime:
+            return mtime, config
+    with open(config_file, encoding="utf-8") as file:
+        config = json.load(file)
+    if mtime is not None:
+        _docker_configs[config_file] = (mtime, config)
+    return mtime, config
+
+
+def _get_helper_credentials(helper, registry, config_mtime=None, cache_ttl=0):
     """
-    Gets the credentials from ~/.docker/config.json
+    Gets the credentials from a docker-credential-* helper, caching them in memory
+    for CREDS_HELPER_TTL seconds and, if cache_ttl is set, in the credentials agent
+    for cache_ttl seconds as long as the Docker config file isn't modified
+    """
+    key = (helper, registry)
+    if key in _helper_credentials:
+        timestamp, cached_mtime, creds = _helper_credentials[key]
+        if time.monotonic() - timestamp < CREDS_HELPER_TTL and cached_mtime == config_mtime:
+            return creds
+    if cache_ttl:
+        from . import credagent  # pylint: disable=import-outside-toplevel
+        creds = credagent.get_credentials(f"{helper}/{registry}", config_mtime)
+        if creds:
+            _helper_credentials[key] = (time.monotonic(), config_mtime, creds)
+            return creds
+    import dockerpycreds  # pylint: disable=import-outside-toplevel
+    store = dockerpycreds.Store(helper)
+    creds = store.get(registry)
+    creds = creds['Username'], creds['Secret']
+    _helper_credentials[key] = (time.monotonic(), config_mtime, creds)
+    if cache_ttl:
+        credagent.put_credentials(f"{helper}/{registry}", config_mtime, creds, cache_ttl)
+    return creds
+
+
+def get_docker_credentials(registry, cache_ttl=0):
+    """
+    Gets the credentials from ~/.docker/config.json.
+    Output of credential helpers is kept in the credentials agent for cache_ttl seconds if set
     """
     config_file = os.path.join(
         os.getenv("DOCKER_CONFIG", os.path.expanduser(os.path.join("~", ".docker"))), "config.json")
     try:
-        with open(config_file, encoding="utf-8") as file:
-            config = json.load(file)
+        config_mtime, config = _load_docker_config(config_file)
     except OSError:
         return None
     registry = re.sub("^https?://", "", registry)
@@ -71,9 +128,73 @@ def get_docker_credentials(registry):
             pass
     try:
         if registry in config['credHelpers']:
-            store = dockerpycreds.Store(config['credHelpers'][registry])
-            creds = store.get(registry)
-            return creds['Username'], creds['Secret']
+            return _get_helper_credentials(
+                config['credHelpers'][registry], registry, config_mtime=config_mtime, cache_ttl=cache_ttl)
     except KeyError:
         pass
     return None
+
+
+def _get_cache_file(name):
+    """
+    Returns the path of a file in the cache directory
+    """
+    cache_dir = os.getenv("XDG_CACHE_HOME", os.path.expanduser(os.path.join("~", ".cache")))
+    name = re.sub(r"[^\w.-]", "_", name)
+    return os.path.join(cache_dir, "regview", f"{name}.json")
+
+
+def _read_cache_file(path, ttl):
+    """
+    Reads a cache file if not older than ttl seconds
+    """
+    try:
+        with open(path, encoding="utf-8") as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict) or time.time() - data.get('timestamp', 0) > ttl:
+        return None
+    return data
+
+
+def _write_cache_file(path, data):
+    """
+    Writes a cache file readable only by the user
+    """
+    data = dict(data, timestamp=time.time())
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        # mkstemp creates the file with mode 0600
+        fd, tmp_file = tempfile.mkstemp(dir=directory)
+    except OSError:
+        return
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        os.replace(tmp_file, path)
+    except (OSError, TypeError, ValueError):
+        os.unlink(tmp_file)
+
+
+def _get_state_file(registry):
+    """
+    Returns the path of the state file for registry.
+    The scheme is part of the key so an explicit http:// never affects the probe of a bare host
+    """
+    return _get_cache_file(registry)
+
+
+def load_registry_state(registry, ttl=3600):
+    """
+    Loads the cached state for registry if not older than ttl seconds
+    """
+    return _read_cache_file(_get_state_file(registry), ttl)
+
+
+def save_registry_state(registry, state):
+    """
+    Saves the state for registry
+    """
+    _write_cache_file(_get_state_file(registry), state)
@@ -0,0 +1,181 @@
+# pylint: disable=invalid-name,line-too-long,missing-module-docstring,missing-class-docstring,missing-function-docstring
+
+import argparse
+import io
+import itertools
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import unittest
+
+from contextlib import redirect_stdout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
+
+from regview.docker_registry import DockerRegistry
+from regview.regview import DockerRegistryInfo
+from regview.utils import load_registry_state, save_registry_state
+
+
+REPOS = [f"repo{i:03}" for i in range(250)]
+
+
+class RegistryHandler(BaseHTTPRequestHandler):
+    """
+    Paginated Docker Registry stand-in with a default page size of 100 & a maximum of 500
+    and token authentication if the server has a realm.  Tokens from /oldtoken are rejected
+    """
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        url = urlparse(self.path)
+        self.server.paths.append(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        link = None
+        realm = getattr(self.server, "realm", None)
+        if url.path in ("/token", "/oldtoken"):
+            body = {"token": url.path[1:]}
+        elif realm and self.headers.get("Authorization") != "Bearer token":
+            data = b"{}"
+            self.send_response(401)
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("WWW-Authenticate", f'Bearer realm="{self.server.url}{realm}",service="test"')
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        elif url.path == "/v2/_catalog":
+            n = int(query.get('n', 100))
+            if n > 500:
+                self.send_error(400, "PAGINATION_NUMBER_INVALID")
+                return
+            start = REPOS.index(query['last']) + 1 if 'last' in query else 0
+            body = {"repositories": REPOS[start:start + n]}
+            if start + n < len(REPOS):
+                link = f'</v2/_catalog?last={REPOS[start + n - 1]}&n={n}>; rel="next"'
+        elif url.path.endswith("/tags/list"):
+            body = {"tags": ["latest"]}
+        else:
+            body = {}
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        if link:
+            self.send_header("Link", link)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        pass
+
+
+class Test_pagination(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), RegistryHandler)
+        self.server.paths = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.server.url = self.url
+
+    def catalog_paths(self):
+        return [path for path in self.server.paths if path.startswith("/v2/_catalog")]
+
+    def test_default_page_size(self):
+        with DockerRegistry(self.url) as reg:
+            self.assertEqual(list(reg.get_repos()), REPOS)
+        self.assertEqual(len(self.catalog_paths()), 3)
+
+    def test_page_size(self):
+        with DockerRegistry(self.url, page_size=500) as reg:
+            self.assertEqual(list(reg.get_repos()), REPOS)
+        self.assertEqual(self.catalog_paths(), ["/v2/_catalog?n=500"])
+
+    def test_page_size_too_large(self):
+        with DockerRegistry(self.url, page_size=1000) as reg:
+            self.assertEqual(list(reg.get_repos()), REPOS)
+            self.assertEqual(list(reg.get_repos()), REPOS)
+        # n is dropped after the registry rejects it
+        self.assertEqual(self.catalog_paths()[:2], ["/v2/_catalog?n=1000", "/v2/_catalog"])
+        self.assertEqual(len(self.catalog_paths()), 7)
+
+    def test_single_page_no_thread(self):
+        with DockerRegistry(self.url) as reg, patch("regview.docker_registry.ThreadPoolExecutor") as executor:
+            self.assertEqual(list(reg.get_tags("repo000", None)), ["latest"])
+            executor.assert_not_called()
+
+    def test_pattern(self):
+        with DockerRegistry(self.url) as reg:
+            self.assertEqual(list(reg.get_repos("repo24?")), REPOS[240:250])
+            self.assertFalse(reg.get_repos("nomatch*"))
+
+    def test_print_all_no_match(self):
+        opts = argparse.Namespace(workers=None, digests=False, no_trunc=False, verbose=False, all=False, arch=None, os=None)
+        with DockerRegistryInfo(self.url) as reg, patch("regview.regview.opts", opts, create=True), \
+                redirect_stdout(io.StringIO()) as stdout:
+            reg.print_all("nomatch*", None)
+        self.assertEqual(stdout.getvalue(), "")
+
+    def test_prefetch(self):
+        with DockerRegistry(self.url) as reg:
+            repos = reg.get_repos()
+            self.assertEqual(next(repos), REPOS[0])
+            # The second page is requested while the first one is being consumed
+            for _ in range(50):
+                if len(self.catalog_paths()) == 2:
+                    break
+                time.sleep(0.1)
+            self.assertEqual(len(self.catalog_paths()), 2)
+            self.assertEqual(list(repos), REPOS[1:])
+
+    def test_no_prefetch(self):
+        with DockerRegistry(self.url, prefetch=False) as reg, patch("regview.docker_registry.ThreadPoolExecutor") as executor:
+            repos = reg.get_repos()
+            self.assertEqual(next(repos), REPOS[0])
+            self.assertEqual(len(self.catalog_paths()), 1)
+            self.assertEqual(list(repos), REPOS[1:])
+            executor.assert_not_called()
+
+    def test_cached_state_keeps_scheme(self):
+        with tempfile.TemporaryDirectory() as tmpdir, patch.dict(os.environ, {"XDG_CACHE_HOME": tmpdir}):
+            host = self.url[len("http://"):]
+            save_registry_state(host, {"registry": f"https://{host}"})
+            with DockerRegistry(self.url, cache_ttl=3600) as reg:
+                self.assertEqual(reg.registry, self.url)
+
+    def test_stale_state(self):
+        # Nothing listens on the port of a closed socket
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            closed = f"http://127.0.0.1:{sock.getsockname()[1]}"
+        self.server.realm = "/token"
+        stale = [
+            {"registry": closed},
+            {"registry": self.url, "realm": f"{closed}/token", "service": "test"},
+            {"registry": self.url, "realm": f"{self.url}/oldtoken", "service": "test"},
+        ]
+        host = self.url[len("http://"):]
+        for state in stale:
+            with self.subTest(state=state), tempfile.TemporaryDirectory() as tmpdir, \
+                    patch.dict(os.environ, {"XDG_CACHE_HOME": tmpdir}):
+                save_registry_state(host, state)
+                with DockerRegistry(host, auth=("user", "pass"), cache_ttl=3600) as reg:
+                    self.assertEqual(list(reg.get_repos()), REPOS)
+                    self.assertEqual(list(reg.get_tags("repo000", None)), ["latest"])
+                state = load_registry_state(host)
+                state.pop("timestamp")
+                self.assertEqual(
+                    state,
+                    {"registry": self.url, "api_version": None, "realm": f"{self.url}/token", "service": "test"})
+
+    def test_get_images_streams(self):
+        # An endless catalog must not prevent images from being yielded
+        repos = (f"repo{i}" for i in itertools.count())
+        with DockerRegistryInfo(self.url) as reg:
+            images = reg.get_images(repos)
+            self.assertEqual(next(images), ("repo0", ["latest"]))
+            self.assertEqual(next(images), ("repo1", ["latest"]))
+            images.close()
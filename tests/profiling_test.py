@@ -0,0 +1,44 @@
+# pylint: disable=invalid-name,line-too-long,missing-module-docstring,missing-class-docstring,missing-function-docstring
+
+import io
+import json
+import os
+import pstats
+import tempfile
+import time
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stderr
+
+from regview.profiling import Profiler, span
+
+
+@span("work")
+def work():
+    time.sleep(0.05)
+    return sum(range(10000))
+
+
+class Test_profiling(unittest.TestCase):
+    def test_span_disabled(self):
+        self.assertEqual(work(), 49995000)
+
+    def test_profiler(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            prefix = os.path.join(tmpdir, "prof")
+            with redirect_stderr(io.StringIO()) as stderr, Profiler(prefix):
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    list(executor.map(lambda _: work(), range(4)))
+            with open(f"{prefix}.spans.json", encoding="utf-8") as file:
+                spans = json.load(file)
+            self.assertEqual(spans["work"]["calls"], 4)
+            self.assertGreaterEqual(spans["work"]["wall"], 0.2)
+            self.assertGreater(spans["work"]["wait"], spans["work"]["cpu"])
+            self.assertIn("total", spans)
+            self.assertIn("work", stderr.getvalue())
+            # Functions run in worker threads are profiled too
+            stats = pstats.Stats(f"{prefix}.pstats")
+            self.assertTrue(any(func[2] == "work" for func in stats.stats))  # pylint: disable=no-member
+            with open(f"{prefix}.collapsed", encoding="utf-8") as file:
+                self.assertIn("ThreadPoolExecutor", file.read())
@@ -0,0 +1,254 @@
+# pylint: disable=invalid-name,line-too-long,missing-module-docstring,missing-class-docstring,missing-function-docstring
+
+import io
+import json
+import os
+import select
+import shutil
+import socket
+import ssl
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from unittest.mock import patch
+
+import requests
+
+try:
+    from h2.config import H2Configuration
+    from h2.connection import H2Connection
+    from h2.events import DataReceived, RequestReceived, StreamEnded
+    import httpx
+    from regview.transport import HTTP2Adapter
+except ImportError:
+    HTTP2Adapter = None
+
+from regview import regview
+from regview.docker_registry import DockerRegistry
+from regview.utils import print_response
+
+
+class H2Registry:  # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    """
+    Minimal Docker Registry stand-in speaking HTTP/2 with prior knowledge (h2c)
+    or over TLS negotiated with ALPN if given an SSL context.
+    Responses are held until no request arrives for latency seconds
+    """
+
+    def __init__(self, token=None, context=None, latency=0):
+        self.token = token
+        self.context = context
+        self.latency = latency
+        self.connections = 0
+        self.streams = 0
+        self.max_concurrent = 0
+        self.alpn = None
+        self.sock = socket.socket()
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen()
+        scheme = "https" if context else "http"
+        self.url = f"{scheme}://127.0.0.1:{self.sock.getsockname()[1]}"
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def close(self):
+        self.sock.close()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _respond(self, headers):
+        path = headers[':path'].split("?")[0]
+        if self.token and path.startswith("/token"):
+            return 200, {"token": self.token}
+        if self.token and headers.get('authorization') != f"Bearer {self.token}":
+            return 401, {}
+        if path == "/v2/":
+            return 200, {}
+        if path.startswith("/v2/_catalog"):
+            return 200, {"repositories": ["repo"]}
+        if path.endswith("/tags/list"):
+            return 200, {"tags": [str(i) for i in range(100)]}
+        return 200, {"schemaVersion": 2, "config": {"digest": "sha256:0"}, "layers": []}
+
+    def _send(self, h2conn, stream_id, headers):
+        head = headers[':method'] == "HEAD"
+        status, body = self._respond(headers)
+        body = json.dumps(body).encode()
+        headers = [(":status", str(status)), ("content-type", "application/json"),
+                   ("content-length", str(len(body))),
+                   ("docker-distribution-api-version", "registry/2.0"),
+                   ("docker-content-digest", "sha256:1")]
+        if status == 401:
+            headers.append(("www-authenticate", f'Bearer realm="{self.url}/token",service="test"'))
+        h2conn.send_headers(stream_id, headers, end_stream=head)
+        if not head:
+            h2conn.send_data(stream_id, body, end_stream=True)
+
+    def _recv(self, conn, wait):
+        """
+        Returns None if nothing is received for latency seconds while waiting
+        """
+        # Data already decrypted by the TLS layer isn't seen by select()
+        if wait and self.latency and not (self.context and conn.pending()) \
+                and not select.select([conn], [], [], self.latency)[0]:
+            return None
+        return conn.recv(65535)
+
+    def _handle(self, conn):
+        if self.context:
+            try:
+                conn = self.context.wrap_socket(conn, server_side=True)
+            except (OSError, ssl.SSLError):
+                conn.close()
+                return
+            self.alpn = conn.selected_alpn_protocol()
+        h2conn = H2Connection(config=H2Configuration(client_side=False, header_encoding="utf-8"))
+        h2conn.initiate_connection()
+        conn.sendall(h2conn.data_to_send())
+        pending, ready = {}, []
+        with conn:
+            while True:
+                try:
+                    data = self._recv(conn, wait=bool(ready))
+                except OSError:
+                    return
+                if data == b"":
+                    return
+                for event in h2conn.receive_data(data) if data else []:
+                    if isinstance(event, RequestReceived):
+                        pending[event.stream_id] = dict(event.headers)
+                    elif isinstance(event, DataReceived):
+                        h2conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                    elif isinstance(event, StreamEnded):
+                        self.streams += 1
+                        ready.append((event.stream_id, pending.pop(event.stream_id)))
+                if data is None or not self.latency:
+                    self.max_concurrent = max(self.max_concurrent, len(ready))
+                    for stream_id, headers in ready:
+                        self._send(h2conn, stream_id, headers)
+                    ready.clear()
+                conn.sendall(h2conn.data_to_send())
+
+
+@unittest.skipIf(HTTP2Adapter is None, "httpx[http2] not installed")
+class Test_HTTP2Adapter(unittest.TestCase):
+    def test_multiplexed(self):
+        server = H2Registry()
+        self.addCleanup(server.close)
+        with DockerRegistry(server.url, transport=HTTP2Adapter(prior_knowledge=True)) as reg:
+            self.assertEqual(reg.api_version, "registry/2.0")
+            self.assertEqual(list(reg.get_repos()), ["repo"])
+            tags = list(reg.get_tags("repo", None))
+            with ThreadPoolExecutor(max_workers=50) as executor:
+                digests = list(executor.map(lambda t: reg.get_digest("repo", t), tags))
+        self.assertEqual(digests, ["sha256:1"] * 100)
+        self.assertEqual(server.connections, 1)
+        self.assertEqual(server.streams, 103)
+
+    def test_token_auth(self):
+        server = H2Registry(token="secret")
+        self.addCleanup(server.close)
+        with DockerRegistry(server.url, auth=("user", "pass"), transport=HTTP2Adapter(prior_knowledge=True)) as reg:
+            self.assertEqual(reg.session.auth.url, f"{server.url}/token")
+            manifest = reg.get_manifest("repo", "latest")
+        self.assertEqual(manifest['config']['digest'], "sha256:0")
+        self.assertEqual(manifest['docker-content-digest'], "sha256:1")
+
+    def test_print_response(self):
+        request = requests.Request("GET", "https://localhost/v2/").prepare()
+        resp = httpx.Response(200, content=b"{}", extensions={"http_version": b"HTTP/2"})
+        got = HTTP2Adapter().build_response(request, resp)
+        with redirect_stdout(io.StringIO()) as stdout:
+            print_response(got)
+        self.assertIn("> HTTP/2 200 OK", stdout.getvalue())
+
+
+@unittest.skipIf(HTTP2Adapter is None, "httpx[http2] not installed")
+@unittest.skipIf(shutil.which("openssl") is None, "openssl not installed")
+class Test_HTTP2Adapter_TLS(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmpdir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        cls.cert = os.path.join(cls.tmpdir.name, "cert.pem")
+        cls.key = os.path.join(cls.tmpdir.name, "key.pem")
+        subprocess.run(
+            ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+             "-keyout", cls.key, "-out", cls.cert, "-subj", "/CN=localhost",
+             "-addext", "subjectAltName=IP:127.0.0.1,DNS:localhost"],
+            check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+    def setUp(self):
+        # requests lets these override session.verify
+        patcher = patch.dict(os.environ)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for var in ("REQUESTS_CA_BUNDLE", "CURL_CA_BUNDLE"):
+            os.environ.pop(var, None)
+
+    def server(self, client_cert=False, **kwargs):
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(self.cert, self.key)
+        context.set_alpn_protocols(["h2"])
+        if client_cert:
+            context.verify_mode = ssl.CERT_REQUIRED
+            context.load_verify_locations(self.cert)
+        server = H2Registry(context=context, **kwargs)
+        self.addCleanup(server.close)
+        return server
+
+    def test_alpn(self):
+        server = self.server()
+        with DockerRegistry(server.url, verify=self.cert, transport=HTTP2Adapter()) as reg:
+            self.assertEqual(list(reg.get_repos()), ["repo"])
+        self.assertEqual(server.alpn, "h2")
+        self.assertEqual(server.connections, 1)
+
+    def test_untrusted(self):
+        server = self.server()
+        with self.assertLogs(level="ERROR"), self.assertRaises(SystemExit):
+            DockerRegistry(server.url, transport=HTTP2Adapter())
+
+    def test_insecure(self):
+        server = self.server()
+        with DockerRegistry(server.url, verify=False, transport=HTTP2Adapter()) as reg:
+            self.assertEqual(list(reg.get_repos()), ["repo"])
+
+    def test_client_cert(self):
+        server = self.server(client_cert=True)
+        with DockerRegistry(server.url, cert=(self.cert, self.key), verify=self.cert, transport=HTTP2Adapter()) as reg:
+            self.assertEqual(list(reg.get_repos()), ["repo"])
+        with self.assertLogs(level="ERROR"), self.assertRaises(SystemExit):
+            DockerRegistry(server.url, verify=self.cert, transport=HTTP2Adapter())
+
+    def test_ssl_context(self):
+        context = HTTP2Adapter._ssl_context(False, None)  # pylint: disable=protected-access
+        self.assertEqual(context.verify_mode, ssl.CERT_NONE)
+        self.assertFalse(context.check_hostname)
+        context = HTTP2Adapter._ssl_context(self.cert, (self.cert, self.key))  # pylint: disable=protected-access
+        self.assertEqual(context.verify_mode, ssl.CERT_REQUIRED)
+        self.assertEqual(len(context.get_ca_certs()), 1)
+
+    def test_cli_concurrency(self):
+        server = self.server(latency=0.05)
+        argv = ["regview", "--http2", "--cacert", self.cert, "--no-cache", f"{server.url}/repo:*"]
+        with patch.object(sys, "argv", argv), patch.dict(os.environ, {"DOCKER_CONFIG": self.tmpdir.name}), \
+                redirect_stdout(io.StringIO()) as stdout:
+            regview.main()
+        self.assertEqual(len(stdout.getvalue().splitlines()), 101)
+        # Many more manifests are requested at once than the default thread pool allows
+        self.assertGreater(server.max_concurrent, 50)
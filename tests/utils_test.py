@@ -1,9 +1,13 @@
 # pylint: disable=invalid-name,line-too-long,missing-module-docstring,missing-class-docstring,missing-function-docstring
 
+import json
+import os
+import tempfile
 import unittest
 from unittest.mock import patch, mock_open
 
-from regview.utils import pretty_date, pretty_size, get_docker_credentials
+from regview import credagent, utils
+from regview.utils import pretty_date, pretty_size, get_docker_credentials, load_registry_state, save_registry_state
 
 
 class Test_utils(unittest.TestCase):
@@ -28,3 +32,102 @@ class Test_utils(unittest.TestCase):
     def test_get_docker_credentials3(self):
         self.assertEqual(get_docker_credentials("localhost:5000"), ("testuser", "testpassword"))
         self.assertEqual(get_docker_credentials("http://localhost:5000"), ("testuser", "testpassword"))
+
+
+class Test_credentials_cache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        patcher = patch.dict(os.environ, {"DOCKER_CONFIG": self.tmpdir.name, "XDG_CACHE_HOME": self.tmpdir.name, "XDG_RUNTIME_DIR": self.tmpdir.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmpdir.cleanup)
+        self.addCleanup(utils._docker_configs.clear)  # pylint: disable=protected-access
+        self.addCleanup(utils._helper_credentials.clear)  # pylint: disable=protected-access
+        self.config_file = os.path.join(self.tmpdir.name, "config.json")
+
+    def write_config(self, config, mtime):
+        with open(self.config_file, "w", encoding="utf-8") as file:
+            json.dump(config, file)
+        os.utime(self.config_file, (mtime, mtime))
+
+    def test_config_reloaded_on_mtime_change(self):
+        self.write_config({"auths": {"localhost:5000": {"auth": "dGVzdHVzZXI6dGVzdHBhc3N3b3Jk"}}}, 1000)
+        self.assertEqual(get_docker_credentials("localhost:5000"), ("testuser", "testpassword"))
+        with patch("builtins.open") as mocked:
+            self.assertEqual(get_docker_credentials("localhost:5000"), ("testuser", "testpassword"))
+            mocked.assert_not_called()
+        self.write_config({"auths": {"localhost:5000": {"auth": "Zm9vOmJhcg=="}}}, 2000)
+        self.assertEqual(get_docker_credentials("localhost:5000"), ("foo", "bar"))
+
+    @patch("dockerpycreds.Store")
+    def test_helper_credentials_cached(self, store):
+        store.return_value.get.return_value = {"Username": "AWS", "Secret": "secret"}
+        self.write_config({"credHelpers": {"123.dkr.ecr.amazonaws.com": "ecr-login"}}, 1000)
+        for _ in range(3):
+            self.assertEqual(get_docker_credentials("123.dkr.ecr.amazonaws.com"), ("AWS", "secret"))
+        store.assert_called_once_with("ecr-login")
+        store.return_value.get.assert_called_once_with("123.dkr.ecr.amazonaws.com")
+
+    @patch("dockerpycreds.Store")
+    def test_helper_credentials_config_modified(self, store):
+        store.return_value.get.return_value = {"Username": "AWS", "Secret": "secret"}
+        self.write_config({"credHelpers": {"123.dkr.ecr.amazonaws.com": "ecr-login"}}, 1000)
+        get_docker_credentials("123.dkr.ecr.amazonaws.com")
+        self.write_config({"credHelpers": {"123.dkr.ecr.amazonaws.com": "ecr-login"}}, 2000)
+        get_docker_credentials("123.dkr.ecr.amazonaws.com")
+        self.assertEqual(store.return_value.get.call_count, 2)
+
+    @patch("dockerpycreds.Store")
+    def test_helper_credentials_agent(self, store):
+        self.addCleanup(credagent.stop)
+        store.return_value.get.return_value = {"Username": "AWS", "Secret": "secret"}
+        self.write_config({"credHelpers": {"123.dkr.ecr.amazonaws.com": "ecr-login"}}, 1000)
+        self.assertEqual(get_docker_credentials("123.dkr.ecr.amazonaws.com", cache_ttl=60), ("AWS", "secret"))
+        socket_path = credagent.get_socket_path()
+        self.assertEqual(os.stat(socket_path).st_mode & 0o777, 0o600)
+        # A new invocation gets them from the agent instead of running the helper again
+        utils._helper_credentials.clear()  # pylint: disable=protected-access
+        self.assertEqual(get_docker_credentials("123.dkr.ecr.amazonaws.com", cache_ttl=60), ("AWS", "secret"))
+        self.assertEqual(store.return_value.get.call_count, 1)
+        # Unless the Docker config file was modified
+        utils._helper_credentials.clear()  # pylint: disable=protected-access
+        self.write_config({"credHelpers": {"123.dkr.ecr.amazonaws.com": "ecr-login"}}, 2000)
+        get_docker_credentials("123.dkr.ecr.amazonaws.com", cache_ttl=60)
+        self.assertEqual(store.return_value.get.call_count, 2)
+        # Nothing is written to disk besides the config file & the socket
+        files = [os.path.join(root, name) for root, _, names in os.walk(self.tmpdir.name) for name in names]
+        self.assertEqual(sorted(files), sorted([self.config_file, socket_path]))
+
+
+class Test_registry_state(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        patcher = patch.dict(os.environ, {"XDG_CACHE_HOME": self.tmpdir.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmpdir.cleanup)
+
+    def test_load_registry_state_missing(self):
+        self.assertIsNone(load_registry_state("localhost:5000"))
+
+    def test_save_load_registry_state(self):
+        state = {"registry": "https://localhost:5000", "realm": "https://auth/token", "service": "registry"}
+        save_registry_state("localhost:5000", state)
+        self.assertTrue(os.path.isfile(os.path.join(self.tmpdir.name, "regview", "localhost_5000.json")))
+        self.assertEqual({k: v for k, v in load_registry_state("localhost:5000").items() if k != "timestamp"}, state)
+        # An explicit scheme doesn't share the state of the bare host
+        self.assertIsNone(load_registry_state("https://localhost:5000"))
+        self.assertIsNone(load_registry_state("http://localhost:5000"))
+        save_registry_state("http://localhost:5000", {"registry": "http://localhost:5000"})
+        self.assertEqual(load_registry_state("localhost:5000")["registry"], "https://localhost:5000")
+
+    def test_save_registry_state_failure(self):
+        with patch("json.dump", side_effect=TypeError):
+            save_registry_state("localhost:5000", {"registry": "https://localhost:5000"})
+        self.assertEqual(os.listdir(os.path.join(self.tmpdir.name, "regview")), [])
+
+    def test_load_registry_state_expired(self):
+        with patch("time.time", return_value=1000):
+            save_registry_state("localhost:5000", {"registry": "https://localhost:5000"})
+        with patch("time.time", return_value=1000 + 3601):
+            self.assertIsNone(load_registry_state("localhost:5000", ttl=3600))